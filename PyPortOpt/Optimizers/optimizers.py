@@ -5,13 +5,17 @@ and easy to use way.
 This module consists all the functions required to run a portfolio optimization using parameters 
 that the user inputs
 """
-import math
+from functools import lru_cache
 import numpy as np
 from numpy import linalg as LA
 import pandas as pd
 import osqp
 import scipy as sp
 from scipy import sparse
+from scipy.special import comb
+
+# OSQP status values whose solution is used, otherwise the optimizers fall back to equal weights
+_SOLVED = (osqp.constant("OSQP_SOLVED"), osqp.constant("OSQP_SOLVED_INACCURATE"))
 
 
 def testFunction():
@@ -48,21 +52,45 @@ def preprocessData(data):
     df.columns = ["date", "ticker", "price"]
     df1 = df.pivot_table(index=["date"], columns="ticker", values=["price"])
     df1.columns = [col[1] for col in df1.columns.values]
-    df_logret = 100 * (np.log(df1) - np.log(df1.shift(1)))
-    df_logret = df_logret[1:]
-    logret = np.array(df_logret)
-
-    df_daily_returns = df1.pct_change()
-
-    df_daily_returns = df_daily_returns[1:]
-    data = np.array(data)
-    daily_returns = np.array(df_daily_returns)
-    n = logret.shape[0]
+    log_prices = np.log(df1.to_numpy())
+    logret = 100 * np.diff(log_prices, axis=0)
     sigMat = np.cov(logret, rowvar=False)
     meanVec = np.mean(logret, axis=0)
     return meanVec, sigMat
 
 
+def _symPD2x2(A, tol):
+    """
+    SymPDcovmatrix for a symmetric 2x2 matrix, using the closed form eigenvalues
+    tr/2 -+ sqrt((tr/2)^2 - det) and the spectral projectors instead of LAPACK
+
+    Parameters
+    ----------
+    A : Array
+        symmetric 2x2 matrix
+    tol : float
+        minimum value for all eigenvalues
+
+    Returns
+    -------
+    A : Array
+        corrected matrix A.
+    e_min : float
+        minimum value for all eigenvalues
+    """
+    mid = (A[0, 0] + A[1, 1]) / 2
+    rad = np.hypot((A[0, 0] - A[1, 1]) / 2, A[0, 1])
+    lo, hi = mid - rad, mid + rad
+    if lo >= tol:
+        return A, lo
+    if rad == 0:
+        return tol * np.eye(2), tol
+    # projector onto the eigenvector of lo, the one of hi is its complement
+    P_lo = (A - hi * np.eye(2)) / (lo - hi)
+    A = tol * P_lo + max(hi, tol) * (np.eye(2) - P_lo)
+    return A, tol
+
+
 def SymPDcovmatrix(A, tol=None):
     """
     function corrects a covariance matrix A to be symmetric positive definite
@@ -86,17 +114,23 @@ def SymPDcovmatrix(A, tol=None):
         print("Input matrix has to be a square matrix ")
     if not tol:
         tol = 1e-04
-    A = (A + A.transpose()) / 2
-    D, V = LA.eig(A)
-    for i in range(len(D)):
-        if D[i] < tol:
-            D[i] = tol
-
-    D = np.diag(D)
-    t = np.dot(V, D)
-    A = np.dot(t, V.transpose())
-    e_min = max(tol, min(np.diag(D)))
-    A = (A + A.transpose()) / 2
+    # float working copy in column-major layout, the order LAPACK stores matrices in
+    A = np.array(A, dtype=float, order="F")
+    A += A.transpose()
+    A *= 0.5
+    if n == 2:
+        return _symPD2x2(A, tol)
+    # eigenvalues alone are enough when A needs no correction, input that is not
+    # positive definite pays for this solve on top of the full eigh below
+    e_min = LA.eigvalsh(A).min()
+    if e_min >= tol:
+        return A, e_min
+    D, V = LA.eigh(A)
+    np.clip(D, tol, None, out=D)
+    A = np.dot(V * D, V.transpose())
+    e_min = max(tol, D.min())
+    A += A.transpose()
+    A *= 0.5
     return A, e_min
 
 
@@ -114,30 +148,49 @@ def sigMatShrinkage(sigMat, lambda_l2):
     D : Array
     """
     d = sigMat.shape[0]
-    sig = np.sqrt(np.diag(sigMat))
-    t = np.dot(np.diag(sig ** (-1)), sigMat)
-    corrMat = np.dot(t, np.diag(sig ** (-1)))
-    corrs = None
-    for k in range(d - 1):
-        if corrs is None:
-            corrs = np.diag(corrMat, k + 1)
-        else:
-            corrs = np.hstack([corrs, np.diag(corrMat, k + 1)])
-    if 1 == 1:
-        sigMat = sigMat + lambda_l2 * np.mean(sig ** 2) * np.eye(d)
-    else:
-        t = np.dot(
-            np.mean(sig) * np.eye(d),
-            np.eye(d) + (np.ones(d, d) - np.eye(d)) * np.mean(corrs),
-        )
-        sigMat = sigMat + lambda_l2 * np.dot(t, np.mean(sig) * np.eye(d))
+    sig2 = np.diag(sigMat)
+    sigMat = sigMat + lambda_l2 * np.mean(sig2) * np.eye(d)
     return sigMat
 
 
+def _buildDmat(n, k):
+    """
+    Builds the k-th order difference operator, which is banded with the signed
+    binomial coefficients (-1)**j * comb(k, j) on its j-th superdiagonal
+
+    Parameters
+    ----------
+    n : int
+    k : int
+
+    Returns
+    -------
+    D : Array
+    """
+    D = np.zeros((n - k, n))
+    rows = np.arange(n - k)
+    for j in range(k + 1):
+        D[rows, rows + j] = (-1) ** j * comb(k, j)
+    return D
+
+
+@lru_cache(maxsize=128)
+def _cachedDmat(n, k):
+    """
+    Builds Dmat(n, k) once per (n, k) and freezes it, Dmat hands out views
+    """
+    D = _buildDmat(n, k)
+    D.setflags(write=False)
+    return D
+
+
 def Dmat(n, k):
     """
     function reform a matrix for assets with order
 
+    Results are cached per (n, k). Each call returns a read-only view of the
+    cached array, which cannot be made writeable again, copy it to modify.
+
     Parameters
     ----------
     n : int
@@ -147,22 +200,83 @@ def Dmat(n, k):
     -------
     D : Array
     """
-    if k == 0:
-        D = np.eye(n)
-    elif k == 1:
-        D = np.eye(n - 1, n)
-        for i in range(n - 1):
-            D[i, i + 1] = -1
+    return _cachedDmat(n, k).view()
+
+
+def _solveQP(P, q, A, l, u, workspace=None):
+    """
+    Solves the quadratic program min 1/2 x'Px + q'x s.t. l <= Ax <= u with OSQP
+
+    If a workspace is given and P and A have the same sparsity pattern as the
+    problem stored in it, the stored solver is updated in place, which skips
+    the setup and the symbolic factorization. Otherwise a new solver is set up
+    and stored in the workspace.
+
+    Parameters
+    ----------
+    P : Matrix
+        upper triangular part of the quadratic cost, as stored by OSQP
+    q : Array
+    A : Matrix
+    l : Array
+    u : Array
+    workspace : Dictionary
+        (optional) solver state shared between calls
+
+    Returns
+    -------
+    res : OSQP results
+    """
+    P = sparse.csc_matrix(P)
+    A = sparse.csc_matrix(A)
+    pattern = (P.shape, P.indptr, P.indices, A.shape, A.indptr, A.indices)
+    if workspace is not None and "prob" in workspace and all(
+        np.array_equal(old, new) for old, new in zip(workspace["pattern"], pattern)
+    ):
+        prob = workspace["prob"]
+        prob.update(Px=P.data, q=q, Ax=A.data, l=l, u=u)
     else:
-        D = Dmat(n, 1)
-        for i in range(k - 1):
-            Dn = Dmat(n - i - 1, 1)
-            D = np.dot(Dn, D)
-    return D
+        prob = osqp.OSQP()
+        # Setup workspace
+        prob.setup(P, q, A, l, u, verbose=False)
+        if workspace is not None:
+            workspace["prob"] = prob
+            workspace["pattern"] = pattern
+    return prob.solve()
+
+
+def _minVarAnalytic(sigMat, maxAlloc=1):
+    """
+    Closed form minimum variance weights w = sigMat^-1 1 / (1' sigMat^-1 1)
+    of the problem with the budget constraint only
+
+    Parameters
+    ----------
+    sigMat : Matrix
+        symmetric positive definite covariance matrix
+    maxAlloc : Float
+        maximum weight an asset can get
+
+    Returns
+    -------
+    w : Array
+        the weights, or None if they violate 0 <= w <= maxAlloc
+    """
+    w = LA.solve(sigMat, np.ones(sigMat.shape[0]))
+    w = w / w.sum()
+    if w.min() < 0 or w.max() > maxAlloc:
+        return None
+    return w
 
 
 def minimumVariancePortfolio(
-    sigMat, longShort, maxAlloc=1, lambda_l1=0, lambda_l2=0, assetsOrder=None
+    sigMat,
+    longShort,
+    maxAlloc=1,
+    lambda_l1=0,
+    lambda_l2=0,
+    assetsOrder=None,
+    workspace=None,
 ):
     """
     Optimizes portfolio for minimum variance
@@ -178,6 +292,8 @@ def minimumVariancePortfolio(
         Takes a value greater than 0. Specifies L1 penalty
     lambda_l2 : Float
         Takes a value greater than 0. Specifies L2 penalty
+    workspace : Dictionary
+        (optional) OSQP solver state reused between calls with the same problem structure
 
     Returns
     -------
@@ -197,23 +313,26 @@ def minimumVariancePortfolio(
     else:
         sigMat, e_min = SymPDcovmatrix(sigMat)
 
-    if longShort == 0:
-        Aeq = np.ones(d)
+    w_opt = None
+    if longShort == 0 and not assetsOrder:
+        # the L1 penalty is constant on the budget constraint, so if the bounds
+        # are not binding the closed form solution is optimal
+        w_opt = _minVarAnalytic(sigMat, maxAlloc)
+
+    if longShort == 0 and w_opt is None:
+        Aeq = sparse.csc_matrix(np.ones((1, d)))
         Beq = 1
         LB = np.zeros(d)
         UB = maxAlloc * np.ones(d)
         if assetsOrder:
             L_ine = -np.ones(d - 1)
-            D = np.eye(d - 1, d)
-            for i in range(d - 1):
-                D[i, i + 1] = -1
-            A = -1 * D
+            A = -1 * sparse.csc_matrix(Dmat(d, 1))
             B = np.zeros(d - 1)
-            A = np.vstack([A, Aeq, np.eye(d)])
+            A = sparse.vstack([A, Aeq, sparse.eye(d)], format="csc")
             l = np.hstack([L_ine, Beq, LB])
             u = np.hstack([B, Beq, UB])
         else:
-            A = np.vstack([Aeq, np.eye(d)])
+            A = sparse.vstack([Aeq, sparse.eye(d)], format="csc")
             l = np.hstack([Beq, LB])
             u = np.hstack([Beq, UB])
 
@@ -222,46 +341,40 @@ def minimumVariancePortfolio(
         else:
             meanVec = -np.zeros(d)
 
-        P = sparse.csc_matrix(sigMat)
-        A = sparse.csc_matrix(A)
+        P = sparse.triu(sigMat, format="csc")
 
-        prob = osqp.OSQP()
-        # Setup workspace
-        prob.setup(P, -meanVec, A, l, u, verbose=False)
         # Solve problem
-        res = prob.solve()
-        w_opt = res.x
-        if not w_opt.all():
+        res = _solveQP(P, -meanVec, A, l, u, workspace)
+        if res.info.status_val in _SOLVED:
+            w_opt = res.x
+        else:
             w_opt = np.ones(d) / d
 
     elif longShort != 0:
-        A = np.hstack([np.zeros(d), np.ones(d), np.zeros(d)])
+        eye = sparse.eye(d, format="csc")
+        ones = sparse.csc_matrix(np.ones((1, d)))
+        # block rows over the variables (w, u, v)
+        A = [[None, ones, None]]
         B = 1 + abs(longShort)
         Grenze = min(abs(longShort), maxAlloc)
         if assetsOrder:
             L_ine = np.hstack([0, -(1 + 2 * Grenze) * np.ones(d - 1)])
-            D = np.eye(d - 1, d)
-            for i in range(d - 1):
-                D[i, i + 1] = -1
-            A = np.vstack([A, np.hstack([-1 * D, np.zeros((d - 1, 2 * d))])])
+            A.append([-1 * sparse.csc_matrix(Dmat(d, 1)), None, None])
             B = np.hstack([B, np.zeros(d - 1)])
         else:
             L_ine = 0
-        Aeq = np.vstack(
-            [
-                np.hstack([np.eye(d), -np.eye(d), np.eye(d)]),
-                np.hstack([np.ones(d), np.zeros(d), np.zeros(d)]),
-            ]
-        )
+        Aeq = [[eye, -eye, eye], [ones, None, None]]
         Beq = np.hstack([np.zeros(d), 1])
         LB = np.hstack([-Grenze * np.ones(d), np.zeros(2 * d)])
         UB = maxAlloc * np.ones(3 * d)
-        sigMat3d = np.vstack(
-            [np.hstack([sigMat, np.zeros((d, 2 * d))]), np.zeros((2 * d, 3 * d))]
-        )
-
-        sigMat3d = sigMat3d + np.diag(
-            np.hstack([-0.1 * e_min * np.ones(d), 0.1 * e_min * np.ones(2 * d)])
+        reg = 0.1 * e_min * sparse.eye(d)
+        sigMat3d = sparse.bmat(
+            [
+                [sparse.triu(sigMat) - reg, None, None],
+                [None, reg, None],
+                [None, None, reg],
+            ],
+            format="csc",
         )
 
         if lambda_l1:
@@ -269,23 +382,19 @@ def minimumVariancePortfolio(
         else:
             meanvec3d = np.hstack([np.zeros(d), np.zeros(2 * d)])
 
-        A = np.vstack([A, Aeq, np.eye(3 * d)])
+        A = sparse.bmat(
+            A + Aeq + [[eye, None, None], [None, eye, None], [None, None, eye]],
+            format="csc",
+        )
         l = np.hstack([L_ine, Beq, LB])
         u = np.hstack([B, Beq, UB])
 
-        A = sparse.csc_matrix(A)
-        sigMat3d = sparse.csc_matrix(sigMat3d)
-
-        prob = osqp.OSQP()
-        # Setup workspace
-        prob.setup(sigMat3d, -meanvec3d, A, l, u, verbose=False)
         # Solve problem
-        res = prob.solve()
-        wuv_opt = res.x
-        if not wuv_opt.all():
-            w_opt = np.ones(d) / d
+        res = _solveQP(sigMat3d, -meanvec3d, A, l, u, workspace)
+        if res.info.status_val in _SOLVED:
+            w_opt = res.x[:d]
         else:
-            w_opt = wuv_opt[:d]
+            w_opt = np.ones(d) / d
 
     t = np.dot(w_opt, sigMat)
     Var_opt = np.dot(t, w_opt.transpose())
@@ -305,6 +414,7 @@ def meanVariancePortfolioReturnsTarget(
     lambda_l1=0,
     lambda_l2=0,
     assetsOrder=None,
+    workspace=None,
 ):
     """
     Mean-Variance portfolio for a target return
@@ -325,6 +435,8 @@ def meanVariancePortfolioReturnsTarget(
         Takes a value greater than 0. Specifies L1 penalty
     lambda_l2 : Float
         Takes a value greater than 0. Specifies L2 penalty
+    workspace : Dictionary
+        (optional) OSQP solver state reused between calls with the same problem structure
 
     Returns
     -------
@@ -353,7 +465,7 @@ def meanVariancePortfolioReturnsTarget(
         sigMat, e_min = SymPDcovmatrix(sigMat)
 
     if longShort == 0:
-        Aeq = np.ones(d)
+        Aeq = sparse.csc_matrix(np.ones((1, d)))
         Beq = 1
         LB = np.zeros(d)
         UB = maxAlloc * np.ones(d)
@@ -361,13 +473,13 @@ def meanVariancePortfolioReturnsTarget(
         if assetsOrder:
             L_ine = np.hstack([-np.inf, -np.ones(d - 1)])
             tau = dailyRetTarget
-            A = -meanVec
+            A = sparse.csc_matrix(-meanVec)
             B = -tau
-            A = np.vstack([A, -1 * Dmat(d, 1)])
+            A = sparse.vstack([A, -1 * sparse.csc_matrix(Dmat(d, 1))])
             B = np.hstack([B, np.zeros(d - 1)])
         else:
             tau = dailyRetTarget
-            A = -meanVec
+            A = sparse.csc_matrix(-meanVec)
             B = -tau
             L_ine = -np.inf
 
@@ -376,53 +488,51 @@ def meanVariancePortfolioReturnsTarget(
         else:
             meanVec = -np.zeros(d)
 
-        A = np.vstack([A, Aeq, np.eye(d)])
+        A = sparse.vstack([A, Aeq, sparse.eye(d)], format="csc")
         l = np.hstack([L_ine, Beq, LB])
         u = np.hstack([B, Beq, UB])
-        P = sparse.csc_matrix(sigMat)
-        A = sparse.csc_matrix(A)
+        P = sparse.triu(sigMat, format="csc")
 
-        prob = osqp.OSQP()
-        # Setup workspace
-        prob.setup(P, -meanVec, A, l, u, verbose=False)
         # Solve problem
-        res = prob.solve()
-        w_opt = res.x
-        if not w_opt.all():
+        res = _solveQP(P, -meanVec, A, l, u, workspace)
+        if res.info.status_val in _SOLVED:
+            w_opt = res.x
+        else:
             w_opt = np.ones(d) / d
 
     elif longShort != 0:
-        A = np.hstack([np.zeros(d), np.ones(d), np.zeros(d)])
+        eye = sparse.eye(d, format="csc")
+        ones = sparse.csc_matrix(np.ones((1, d)))
+        # block rows over the variables (w, u, v)
+        A = [[None, ones, None]]
         B = 1 + abs(longShort)
         Grenze = min(abs(longShort), maxAlloc)
 
         if assetsOrder:
             tau = dailyRetTarget
-            A = np.vstack([A, np.hstack([-meanVec, np.zeros(2 * d)])])
+            A.append([sparse.csc_matrix(-meanVec), None, None])
             B = np.hstack([B, -tau])
-            A = np.vstack([A, np.hstack([-1 * Dmat(d, 1), np.zeros((d - 1, 2 * d))])])
+            A.append([-1 * sparse.csc_matrix(Dmat(d, 1)), None, None])
             B = np.hstack([B, np.zeros(d - 1)])
             L_ine = np.hstack([0, -np.inf, -(1 + 2 * Grenze) * np.ones(d - 1)])
         else:
             tau = dailyRetTarget
-            A = np.vstack([A, np.hstack([-meanVec, np.zeros(2 * d)])])
+            A.append([sparse.csc_matrix(-meanVec), None, None])
             B = np.hstack([B, -tau])
             L_ine = np.hstack([0, -np.inf])
 
-        Aeq = np.vstack(
-            [
-                np.hstack([np.eye(d), -np.eye(d), np.eye(d)]),
-                np.hstack([np.ones((1, d)), np.zeros((1, d)), np.zeros((1, d))]),
-            ]
-        )
+        Aeq = [[eye, -eye, eye], [ones, None, None]]
         Beq = np.hstack([np.zeros(d), 1])
         LB = np.hstack([-Grenze * np.ones(d), np.zeros(2 * d)])
         UB = maxAlloc * np.ones(3 * d)
-        sigMat3d = np.vstack(
-            [np.hstack([sigMat, np.zeros((d, 2 * d))]), np.zeros((2 * d, 3 * d))]
-        )
-        sigMat3d = sigMat3d + np.diag(
-            np.hstack([-0.1 * e_min * np.ones(d), 0.1 * e_min * np.ones(2 * d)])
+        reg = 0.1 * e_min * sparse.eye(d)
+        sigMat3d = sparse.bmat(
+            [
+                [sparse.triu(sigMat) - reg, None, None],
+                [None, reg, None],
+                [None, None, reg],
+            ],
+            format="csc",
         )
 
         if lambda_l1:
@@ -430,21 +540,19 @@ def meanVariancePortfolioReturnsTarget(
         else:
             meanvec3d = np.hstack([np.zeros(d), np.zeros(2 * d)])
 
-        A = np.vstack([A, Aeq, np.eye(3 * d)])
+        A = sparse.bmat(
+            A + Aeq + [[eye, None, None], [None, eye, None], [None, None, eye]],
+            format="csc",
+        )
         l = np.hstack([L_ine, Beq, LB])
         u = np.hstack([B, Beq, UB])
-        A = sparse.csc_matrix(A)
-        sigMat3d = sparse.csc_matrix(sigMat3d)
-        prob = osqp.OSQP()
-        # Setup workspace
-        prob.setup(sigMat3d, -meanvec3d, A, l, u, verbose=False)
+
         # Solve problem
-        res = prob.solve()
-        wuv_opt = res.x
-        if not wuv_opt.all():
-            w_opt = np.ones(d) / d
+        res = _solveQP(sigMat3d, -meanvec3d, A, l, u, workspace)
+        if res.info.status_val in _SOLVED:
+            w_opt = res.x[:d]
         else:
-            w_opt = wuv_opt[:d]
+            w_opt = np.ones(d) / d
     t = np.dot(w_opt, sigMat)
     Var_opt = np.dot(t, w_opt.transpose())
     if assetsOrder:
@@ -468,16 +576,9 @@ def check_missing(df_logret):
     res : pandas.core.frame.DataFrame
        the price window without missing value
     """
-    df_logret = df_logret.transpose()
-    flag = np.zeros(len(df_logret))
-    for i in range(len(df_logret)):
-        if df_logret.iloc[i, :].isnull().any():
-            flag[i] = 0
-        else:
-            flag[i] = 1
-    df_logret["missing_flag"] = flag
-    res = df_logret.loc[df_logret["missing_flag"] == 1]
-    return res.transpose()
+    keep = ~df_logret.isna().to_numpy().any(axis=0)
+    res = df_logret.loc[:, keep]
+    return res
 
 
 def rollingwindow_backtest(
@@ -544,72 +645,71 @@ def rollingwindow_backtest(
     df.columns = ["date", "ticker", "price"]
     df1 = df.pivot_table(index=["date"], columns="ticker", values=["price"])
     df1.columns = [col[1] for col in df1.columns.values]
-    df_logret = 100 * (np.log(df1) - np.log(df1.shift(1)))
-    df_logret = df_logret[1:]
-    logret = np.array(df_logret)
+    log_prices = np.log(df1.to_numpy())
+    logret = 100 * np.diff(log_prices, axis=0)
+    df_logret = pd.DataFrame(logret, index=df1.index[1:], columns=df1.columns)
+    missing = np.isnan(logret)
+    X = np.nan_to_num(logret, nan=0) / 100
     n = logret.shape[0]
     d = rebalance_time
     start = window_size
-    R = None
-    portfolio_return = None
-    w_all = None
-    for i in range(start, n, d):
-        k = 0
-        w_opt = np.zeros(df1.shape[1])
-        # import pdb; pdb.set_trace()
-        window = check_missing(df_logret[i - window_size : i] / 100)
-        m = window.shape[0]
-        sample_stocks = window.columns
-        logret_window = np.array(window.iloc[: n - 1])
-        sigMat = np.cov(logret_window, rowvar=False)
-        meanVec = np.mean(logret_window, axis=0) / 100
-
-        if optimizerName == "minimumVariancePortfolio":
-            w_sample, _ = minimumVariancePortfolio(
-                sigMat,
-                float(maxAlloc),
-                float(longShort),
-                float(lambda_l1),
-                float(lambda_l2),
-            )
-
-        elif optimizerName == "meanVariancePortfolioReturnsTarget":
-            w_sample, _ = meanVariancePortfolioReturnsTarget(
-                meanVec,
-                sigMat,
-                float(retTarget),
-                float(maxAlloc),
-                float(longShort),
-                float(lambda_l1),
-                float(lambda_l2),
-            )
-        elif optimizerName == "test":
-            import test
-            test.displayText()
-            
-        for j in range(df1.shape[1]):
-            if df1.columns[j] in sample_stocks:
-                w_opt[j] = w_sample[k]
-                k += 1
-
-        if w_all is None:
-            w_all = w_opt
+    rebalance_days = range(start, n, d)
+    R = np.zeros(max(n - start, 0))
+    w_all = np.zeros((len(rebalance_days), df1.shape[1]))
+    m = window_size
+    # a single observation has no sample covariance, such windows hold equal weights
+    single_observation = m < 2
+    # running sums S = X'X and s of the window, only the rows that entered and left
+    # it are touched; they are rebuilt from scratch once the window has been fully
+    # replaced, so rounding errors do not accumulate over long backtests
+    rebuild = max(1, window_size // d)
+    workspace = {}
+    for step, i in enumerate(rebalance_days):
+        keep = ~missing[i - window_size : i].any(axis=0)
+        if single_observation:
+            w_sample = np.ones(keep.sum()) / keep.sum()
         else:
-            w_all = np.vstack([w_all, w_opt])
-
-        if (i + d) < n:
-            if R is None:
-                logret_sample = np.nan_to_num(logret[i : i + d], nan=0)
-                simple_returns = 100 * (math.exp(1) ** (logret_sample / 100) - 1)
-                R = np.dot(w_opt, simple_returns.transpose())
+            if step % rebuild == 0:
+                S = np.dot(X[i - window_size : i].T, X[i - window_size : i])
+                s = X[i - window_size : i].sum(axis=0)
             else:
-                logret_sample = np.nan_to_num(logret[i : i + d], nan=0)
-                simple_returns = 100 * (math.exp(1) ** (logret_sample / 100) - 1)
-                R = np.hstack([R, np.dot(w_opt, simple_returns.transpose())])
-        elif (i + d) >= n:
-            logret_sample = np.nan_to_num(logret[i:], nan=0)
-            simple_returns = 100 * (math.exp(1) ** (logret_sample / 100) - 1)
-            R = np.hstack([R, np.dot(w_opt, simple_returns.transpose())])
+                X_in = X[i - d : i]
+                X_out = X[i - window_size - d : i - window_size]
+                S += np.dot(X_in.T, X_in) - np.dot(X_out.T, X_out)
+                s += X_in.sum(axis=0) - X_out.sum(axis=0)
+            sigMat = (S - np.outer(s, s) / m)[np.ix_(keep, keep)] / (m - 1)
+            meanVec = s[keep] / m / 100
+
+            if optimizerName == "minimumVariancePortfolio":
+                w_sample, _ = minimumVariancePortfolio(
+                    sigMat,
+                    float(maxAlloc),
+                    float(longShort),
+                    float(lambda_l1),
+                    float(lambda_l2),
+                    workspace=workspace,
+                )
+
+            elif optimizerName == "meanVariancePortfolioReturnsTarget":
+                w_sample, _ = meanVariancePortfolioReturnsTarget(
+                    meanVec,
+                    sigMat,
+                    float(retTarget),
+                    float(maxAlloc),
+                    float(longShort),
+                    float(lambda_l1),
+                    float(lambda_l2),
+                    workspace=workspace,
+                )
+            elif optimizerName == "test":
+                import test
+                test.displayText()
+
+        w_opt = w_all[step]
+        w_opt[keep] = w_sample
+
+        simple_returns = 100 * np.expm1(X[i : i + d])
+        R[i - start : i - start + d] = np.dot(w_opt, simple_returns.transpose())
     rownames = df1.index[start + 1 :]
     return R, df_logret, w_all, rownames
 
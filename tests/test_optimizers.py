@@ -1,6 +1,9 @@
 from PyPortOpt import Optimizers as o
 import unittest
 import numpy as np
+import pandas as pd
+import osqp
+from scipy import sparse
 
 
 class TestOptimizer(unittest.TestCase):
@@ -80,6 +83,17 @@ class TestOptimizer(unittest.TestCase):
         eig, _ = np.linalg.eig(mat)
         self.assertTrue(np.any(eig > 0))
 
+        SPD2 = np.array([[2.0, 0.5], [0.5, 1.0]])
+        nonSPD2 = np.array([[1.0, 2.0], [2.0, 1.0]])
+
+        mat, e_min = o.SymPDcovmatrix(SPD2, tol=1e-8)
+        self.assertTrue(np.allclose(mat, SPD2, atol=1e-8))
+        self.assertTrue(np.isclose(e_min, np.linalg.eigvalsh(SPD2).min()))
+
+        mat, e_min = o.SymPDcovmatrix(nonSPD2, tol=1e-4)
+        self.assertTrue(np.allclose(np.linalg.eigvalsh(mat), [1e-4, 3]))
+        self.assertEqual(e_min, 1e-4)
+
     def test_sigMatShrinkage(self):
         a = [[1, 0, 0], [0, 3, 0], [0, 0, 4]]
         a = np.array(a)
@@ -104,6 +118,38 @@ class TestOptimizer(unittest.TestCase):
 
         self.assertTrue(np.allclose(o.Dmat(n, 1), k2))
 
+        n = 6
+        k3 = np.array(
+            [
+                [1, -2, 1, 0, 0, 0],
+                [0, 1, -2, 1, 0, 0],
+                [0, 0, 1, -2, 1, 0],
+                [0, 0, 0, 1, -2, 1],
+            ]
+        )
+        k4 = np.array(
+            [
+                [1, -3, 3, -1, 0, 0],
+                [0, 1, -3, 3, -1, 0],
+                [0, 0, 1, -3, 3, -1],
+            ]
+        )
+
+        self.assertTrue(np.allclose(o.Dmat(n, 2), k3))
+
+        self.assertTrue(np.allclose(o.Dmat(n, 3), k4))
+
+        k4 = np.dot(o.Dmat(n - 1, 2), o.Dmat(n, 1))
+        self.assertTrue(np.allclose(o.Dmat(n, 3), k4))
+
+        with self.assertRaises(ValueError):
+            o.Dmat(n, 1)[0, 0] = 2
+        with self.assertRaises(ValueError):
+            o.Dmat(n, 1).setflags(write=True)
+        D = o.Dmat(n, 1).copy()
+        D[0, 0] = 2
+        self.assertTrue(np.allclose(o.Dmat(n - 1, 2).dot(o.Dmat(n, 1)), k4))
+
     def test_minimumVariancePortfolio(self):
         data = {
             "Date": {
@@ -228,6 +274,97 @@ class TestOptimizer(unittest.TestCase):
 
         self.assertTrue(np.allclose(var_opt, var_opt_act, atol=1e-8))
 
+    def test_workspace(self):
+        rng = np.random.default_rng(0)
+        minVarWorkspace = {}
+        meanVarWorkspace = {}
+        probs = []
+
+        for d in [5, 5, 4]:
+            X = rng.normal(size=(60, d))
+            sigMat = np.cov(X, rowvar=False)
+            meanVec = np.mean(X, axis=0)
+
+            w_opt, var_opt = o.minimumVariancePortfolio(
+                sigMat, longShort=0.5, maxAlloc=0.4, workspace=minVarWorkspace
+            )
+            w_act, var_act = o.minimumVariancePortfolio(
+                sigMat, longShort=0.5, maxAlloc=0.4
+            )
+            self.assertTrue(np.allclose(w_opt, w_act, atol=1e-3))
+            self.assertTrue(np.allclose(var_opt, var_act, atol=1e-3))
+
+            w_opt, var_opt = o.meanVariancePortfolioReturnsTarget(
+                meanVec, sigMat, 10, longShort=0.5, workspace=meanVarWorkspace
+            )
+            w_act, var_act = o.meanVariancePortfolioReturnsTarget(
+                meanVec, sigMat, 10, longShort=0.5
+            )
+            self.assertTrue(np.allclose(w_opt, w_act, atol=1e-3))
+            self.assertTrue(np.allclose(var_opt, var_act, atol=1e-3))
+
+            probs.append(minVarWorkspace["prob"])
+
+        # the solver is reused while d is unchanged and set up again for the new d
+        self.assertIs(probs[0], probs[1])
+        self.assertIsNot(probs[1], probs[2])
+
+    def test_minimumVariancePortfolioAnalytic(self):
+        sigMat = np.array([[1.0, 0.2, 0.1], [0.2, 2.0, 0.3], [0.1, 0.3, 1.5]])
+        d = sigMat.shape[0]
+
+        w_opt, var_opt = o.minimumVariancePortfolio(sigMat, longShort=0)
+
+        # bounds are not binding, so the closed form solution is returned as is
+        w_act = np.linalg.solve(sigMat, np.ones(d))
+        w_act = w_act / w_act.sum()
+        self.assertTrue(np.allclose(w_opt, w_act, atol=1e-12))
+        self.assertTrue(np.allclose(var_opt, np.dot(np.dot(w_act, sigMat), w_act)))
+
+        # and it agrees with the QP solved by OSQP
+        P = sparse.triu(sigMat, format="csc")
+        A = sparse.vstack([np.ones((1, d)), sparse.eye(d)], format="csc")
+        l = np.hstack([1, np.zeros(d)])
+        u = np.ones(d + 1)
+        prob = osqp.OSQP()
+        prob.setup(
+            P, np.zeros(d), A, l, u, verbose=False, eps_abs=1e-10, eps_rel=1e-10
+        )
+        res = prob.solve()
+        self.assertTrue(np.allclose(w_opt, res.x, atol=1e-6))
+
+    def test_minimumVariancePortfolioCorner(self):
+        # the closed form solution shorts the third asset, so the lower bound binds
+        sigMat = np.array([[1.0, 0.2, 0.9], [0.2, 1.0, 0.9], [0.9, 0.9, 2.0]])
+
+        w_opt, _ = o.minimumVariancePortfolio(sigMat, longShort=0)
+
+        # the corner solution with a zero weight is kept, not replaced by 1/d
+        self.assertTrue(np.allclose(w_opt, [0.5, 0.5, 0], atol=1e-3))
+
+        # an infeasible problem (3 * maxAlloc < 1) falls back to equal weights
+        w_opt, _ = o.minimumVariancePortfolio(sigMat, longShort=0, maxAlloc=0.3)
+
+        self.assertTrue(np.allclose(w_opt, np.ones(3) / 3))
+
+    def test_check_missing(self):
+        df = pd.DataFrame(
+            {
+                "AAPL": [0.1, -0.2, 0.3],
+                "TSLA": [np.nan, 0.5, -0.1],
+                "MSFT": [None, "x", "y"],
+                "AMZN": ["u", "v", "w"],
+            }
+        )
+
+        res = o.check_missing(df)
+
+        self.assertEqual(list(res.columns), ["AAPL", "AMZN"])
+        self.assertEqual(list(res.index), list(df.index))
+        self.assertNotIn("missing_flag", res.columns)
+        self.assertNotIn("missing_flag", res.index)
+        self.assertTrue(np.allclose(res["AAPL"], df["AAPL"]))
+
     def test_rollingWindow(self):
         data = {
             "Date": {
@@ -302,6 +439,63 @@ class TestOptimizer(unittest.TestCase):
         self.assertEqual(len(R), len(rownames))
         self.assertTrue(True)
 
+    def test_rollingWindowStreaming(self):
+        rng = np.random.default_rng(0)
+        tickers = ["AAPL", "MSFT", "TSLA"]
+        dates = pd.date_range("2020-01-01", periods=30).strftime("%Y-%m-%d")
+        prices = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (30, 3)), axis=0))
+        # TSLA only starts trading on the 11th day
+        listed = np.ones((30, 3), dtype=bool)
+        listed[:10, 2] = False
+        rows = [
+            (date, ticker, prices[t, j])
+            for j, ticker in enumerate(tickers)
+            for t, date in enumerate(dates)
+            if listed[t, j]
+        ]
+        data = {
+            "Date": [row[0] for row in rows],
+            "Ticker": [row[1] for row in rows],
+            "Adjusted_Close": [row[2] for row in rows],
+        }
+        window_size, rebalance_time = 8, 3
+
+        R, logRet, w, rownames = o.rollingwindow_backtest(
+            "minimumVariancePortfolio",
+            data,
+            window_size,
+            rebalance_time,
+            longShort=0.5,
+        )
+
+        logret = logRet.to_numpy()
+        n = logret.shape[0]
+        R_act = np.zeros(n - window_size)
+        w_act = []
+        workspace = {}
+        for i in range(window_size, n, rebalance_time):
+            window = logret[i - window_size : i]
+            keep = ~np.isnan(window).any(axis=0)
+            sigMat = np.cov(window[:, keep] / 100, rowvar=False)
+            # same argument order and warm-started workspace as the backtest
+            w_keep, _ = o.minimumVariancePortfolio(
+                sigMat, 1.0, 0.5, 0.0, 0.0, workspace=workspace
+            )
+            w_opt = np.zeros(len(tickers))
+            w_opt[keep] = w_keep
+            w_act.append(w_opt)
+            future = np.nan_to_num(logret[i : i + rebalance_time], nan=0)
+            returns = 100 * np.expm1(future / 100)
+            R_act[i - window_size : i - window_size + rebalance_time] = np.dot(
+                w_opt, returns.transpose()
+            )
+
+        self.assertTrue(np.any(np.array(w_act)[:, 2] == 0))
+        self.assertTrue(np.any(np.array(w_act)[:, 2] != 0))
+        self.assertTrue(np.allclose(w, w_act, atol=1e-6))
+        self.assertTrue(np.allclose(R, R_act, atol=1e-6))
+        self.assertEqual(len(R), len(rownames))
+
 
 if __name__ == "__main__":
     unittest.main()